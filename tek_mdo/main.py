@@ -1,10 +1,16 @@
 from __future__ import annotations
-from pyexpat import model
-from typing import Any, Optional, Type, Callable, Iterable, Sequence, Tuple
-from typing_extensions import Self
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Type, Callable, Iterable, Sequence, Tuple
 from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+import re
+import threading
+import warnings
 
-import pyvisa
+if TYPE_CHECKING:
+    import numpy as np
+    import pyvisa
+    from typing_extensions import Self
 
 
 # Constants
@@ -14,11 +20,146 @@ VI_READ_TERMINATION = '\n'
 
 VI_WRITE_TERMINATION = '\n'
 
-VI_TIMEOUT = 2000
+# A short timeout makes a lost instrument fail fast. Pass a larger `timeout` 
+# to `__init__` for slow operations.
+VI_TIMEOUT = 500
 
 VI_OPEN_TIMEOUT = 0
 
-VI_QUERY_DELAY = 0.001
+# pyvisa sleeps for the query delay on every query, so it is disabled by 
+# default. Use `VisaInstrument.set_query_delay` for devices that need it.
+VI_QUERY_DELAY = 0.0
+
+VI_CHUNK_SIZE = 102400
+
+VI_BINARY_CHUNK_SIZE = 1 << 20
+
+SCPI_COMPOUND_SEPARATOR = ';:'
+
+# Matches the ';' separating the answers of a compound query, but not a ';' 
+# inside a quoted string (followed by an odd number of quotes).
+_REPLY_SEPARATOR_RE = re.compile(r';(?=(?:[^"]*"[^"]*")*[^"]*$)')
+
+# Valid options of the MDO34 settings
+
+_CH_COUPLINGS = frozenset(('AC', 'DC', 'DCREJECT'))
+
+_MATH_TYPES = frozenset(('DUAL', 'FFT', 'ADVANCED', 'SPECTRUM'))
+
+_TRIGGER_TYPES = frozenset(('EDGE', 'LOGIC', 'PULSE', 'BUS', 'VIDEO'))
+
+_TRIGGER_EDGE_COUPLINGS = frozenset(('AC', 'DC', 'HFREJ', 'LFREJ', 'NOISEREJ'))
+
+_TRIGGER_EDGE_SLOPES = frozenset(('RISE', 'FALL', 'EITHER'))
+
+_TRIGGER_EDGE_SOURCES = frozenset(('CH1', 'CH2', 'CH3', 'CH4'))
+
+# Ranges of the MDO34 settings
+
+_CH_POSITION_MIN, _CH_POSITION_MAX = -8, 8
+
+_X_SCALE_MIN, _X_SCALE_MAX = 400e-12, 1000.0
+
+_X_POSITION_MIN, _X_POSITION_MAX = 0, 100
+
+_MAX_LABEL = 30
+
+# The resource manager shared by all the VISA instruments, see `_get_rm`.
+_RM: Optional[pyvisa.ResourceManager] = None
+
+
+# Functions
+
+def _get_rm() -> pyvisa.ResourceManager:
+    """Get the shared VISA resource manager, create it on first use."""
+    global _RM
+    if _RM is None:
+        import pyvisa
+        _RM = pyvisa.ResourceManager()
+    return _RM
+
+def _join_messages(messages: Iterable[str]) -> str:
+    """Join SCPI messages into one compound message.
+
+    Messages are joined with `;:`, so each header is absolute. Common 
+    commands (e.g. `*CLS`, `*OPC?`) are joined with a plain `;`, since a 
+    `:` must not precede a `*` header.
+    """
+    parts = []
+    for message in messages:
+        message = message.lstrip(':')
+        if parts:
+            parts.append(';' if message[:1] == '*' else SCPI_COMPOUND_SEPARATOR)
+        parts.append(message)
+    return ''.join(parts)
+
+
+def _binary_read_defaults(
+    container: Optional[Type | Callable[[Iterable], Sequence]], 
+    chunk_size: Optional[int]
+) -> Tuple[Type | Callable[[Iterable], Sequence], int]:
+    """Fill in the default container and chunk size of binary reads.
+
+    numpy is imported here rather than at module level, so it is only 
+    required when binary values are read.
+    """
+    if container is None:
+        import numpy
+        container = numpy.ndarray
+    if chunk_size is None:
+        chunk_size = VI_BINARY_CHUNK_SIZE
+    return container, chunk_size
+
+
+def _quote(s: str) -> str:
+    """Quote a string argument, doubling the embedded double quotes as 
+    IEEE 488.2 string data requires."""
+    return '"' + s.replace('"', '""') + '"'
+
+
+def _unquote(s: str) -> str:
+    """Remove the surrounding double quotes of a string response, and undo 
+    the doubling of the embedded double quotes."""
+    s = s.strip()
+    return s[1:-1].replace('""', '"') if s[:1] == '"' and s[-1:] == '"' else s
+
+
+def _parse_floats(reply: str, sep: str = ';', count: int = -1) -> np.ndarray:
+    """Parse the numbers of a compound reply in one call to numpy.
+
+    Args:
+        reply: The reply of a compound query.
+        sep: The separator of the answers.
+        count: Number of leading answers to parse, the rest of the reply is 
+            ignored. If negative, all the answers are parsed.
+
+    Returns:
+        The parsed numbers.
+
+    Raises:
+        ValueError: If an answer to parse is not a number, or there are 
+            fewer answers than `count`.
+    """
+    import numpy as np
+
+    text = reply
+    if count >= 0:
+        # numpy fills missing values with garbage when given a count, so 
+        # cut the leading answers and check the total instead
+        fields = reply.split(sep, count)
+        if len(fields) < count:
+            raise ValueError(f'Invalid numeric reply: {reply!r}')
+        text = sep.join(fields[:count])
+    try:
+        with warnings.catch_warnings():
+            # numpy warns and stops early on a non-numeric token
+            warnings.simplefilter('ignore', DeprecationWarning)
+            values = np.fromstring(text, dtype=np.float64, sep=sep)
+    except ValueError:
+        values = None
+    if values is None or values.size != text.count(sep) + 1:
+        raise ValueError(f'Invalid numeric reply: {reply!r}')
+    return values
 
 
 # Classes
@@ -42,6 +183,8 @@ class InstrIOError(Error):
 class BaseInstrument(ABC):
     """ABC of all the instrument model classes."""
 
+    __slots__ = ('__resource_name',)
+
     @property
     @abstractmethod
     def brand(self) -> str:
@@ -131,6 +274,18 @@ class VisaInstrument(BaseInstrument):
     for more information.
     """
 
+    __slots__ = (
+        '_inst', '_write', '_read', '_query', '_batch', '_io_lock', 
+        '_check_future', '__idn', '__resource_info')
+
+    # If True, `_check_communication` runs on a worker thread and `__init__` 
+    # returns immediately. The check is awaited by the first I/O operation, 
+    # which raises its error if it failed. This lets several instruments be 
+    # opened concurrently.
+    DEFERRED_CHECK = False
+
+    _check_executor = ThreadPoolExecutor(thread_name_prefix='VisaInstrumentCheck')
+
     def __init__(
             self, 
             resource_name: str, 
@@ -140,6 +295,7 @@ class VisaInstrument(BaseInstrument):
             open_timeout: int = VI_OPEN_TIMEOUT, 
             query_delay: float = VI_QUERY_DELAY, 
             encoding: str = "ascii",
+            chunk_size: int = VI_CHUNK_SIZE,
             **kwargs: Any
         ):
         """
@@ -154,25 +310,71 @@ class VisaInstrument(BaseInstrument):
                 returns an error.
             query_delay: Delay in seconds between write and read operations.
             encoding: Encoding used for read and write operations.
-            **kwargs: Directly passed to `rm.open_resource`.
+            chunk_size: Size of the chunks (in bytes) used for read 
+                operations. Larger chunks give better throughput for large 
+                transfers.
+            **kwargs: Directly passed to `rm.open_resource`. The resource 
+                manager is shared by all the instances, refer to 
+                `set_resource_manager`.
         """
         super().__init__(resource_name=resource_name)
-        rm = pyvisa.ResourceManager()
+        rm = _get_rm()
         self._inst: pyvisa.resources.MessageBasedResource = rm.open_resource(
             resource_name, read_termination=read_termination, 
             write_termination=write_termination, open_timeout=open_timeout, 
-            timeout=timeout, query_delay=query_delay, encoding=encoding, **kwargs)
-        self._check_communication()
+            timeout=timeout, query_delay=query_delay, encoding=encoding, 
+            chunk_size=chunk_size, **kwargs)
+        # bound methods of the hot I/O path, to skip the attribute lookups
+        self._write = self._inst.write
+        self._read = self._inst.read
+        self._query = self._inst.query
+        self._batch: Optional[List[str]] = None
+        self._io_lock = threading.Lock()
+        self.__idn: Optional[str] = None
+        self.__resource_info: Optional[pyvisa.highlevel.ResourceInfo] = None
+        self._check_future: Optional[Future] = None
+        if self.DEFERRED_CHECK:
+            self._check_future = self._check_executor.submit(self._check_communication)
+        else:
+            self._check_communication()
+
+    @staticmethod
+    def set_resource_manager(rm: pyvisa.ResourceManager) -> None:
+        """Set the resource manager shared by the VISA instruments opened 
+        afterwards, e.g. to use the `@py` backend. By default, 
+        `pyvisa.ResourceManager()` is created on the first use.
+
+        Closing an instrument does not close the resource manager.
+
+        Args:
+            rm: The resource manager to use.
+        """
+        global _RM
+        _RM = rm
 
     @property
     def resource_info(self) -> pyvisa.highlevel.ResourceInfo:
-        """Get the (extended) information of the VISA resource."""
-        return self._inst.resource_info
+        """Get the (extended) information of the VISA resource.
+        
+        The information does not change during the session, so it is cached 
+        after the first access.
+        """
+        if self.__resource_info is None:
+            self.__resource_info = self._inst.resource_info
+        return self.__resource_info
 
     @property
     def idn(self) -> str:
-        """Returns a string that uniquely identifies the instrument."""
-        return self.query('*IDN?')
+        """Returns a string that uniquely identifies the instrument.
+        
+        The IDN does not change during the session, so it is cached after 
+        the first successful query.
+        """
+        # a pending deferred check fills the cache itself
+        self._wait_check()
+        if not self.__idn:
+            self.__idn = self.query('*IDN?')
+        return self.__idn
 
     @property
     def opc(self) -> str:
@@ -192,6 +394,9 @@ class VisaInstrument(BaseInstrument):
         """
         Closes the VISA session and marks the handle as invalid.
         """
+        if self._check_future is not None:
+            # wait for a pending deferred check, its result does not matter
+            self._check_future.exception()
         self._inst.close()
 
     def _check_communication(self) -> None:
@@ -200,18 +405,72 @@ class VisaInstrument(BaseInstrument):
         Raises:
             [InstrIOError][pyinst.errors.InstrIOError]
         """
+        import pyvisa
+
         try:
-            idn = self.idn
+            # not via self.idn: a deferred check must not wait for itself
+            idn = self._query('*IDN?')
             if not idn:
                 raise ValueError("Empty IDN.")
         except pyvisa.VisaIOError as e:
             raise InstrIOError("Check communication failed.")
+        self.__idn = idn
+
+    def _wait_check(self) -> None:
+        """Wait for the deferred communication check, if any.
+
+        Raises:
+            [InstrIOError][pyinst.errors.InstrIOError]
+        """
+        if self._check_future is not None:
+            self._check_future.result()
+            self._check_future = None
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Buffer the commands and send them as one compound command.
+
+        Inside the context, `command()` does not write to the instrument but 
+        appends the message to a buffer. When the context exits without 
+        error, the buffered messages are joined with the SCPI compound 
+        separator `;:` and sent with a single write operation, which saves 
+        one VISA round trip per command. If an exception is raised inside 
+        the context, the buffered commands are discarded.
+
+        Any other I/O operation inside the context (`write`, `query`, 
+        `read`, etc.) first sends the commands buffered so far, so they 
+        reach the instrument in program order.
+
+        Nested `batch()` contexts are merged into the outermost one.
+
+        Examples:
+            >>> with scope.batch():
+            ...     scope.set_channel_scale(1, 0.5)
+            ...     scope.set_channel_position(1, 0)
+        """
+        if self._batch is not None:
+            yield
+            return
+        self._batch = []
+        try:
+            yield
+            self._flush_batch()
+        finally:
+            self._batch = None
+
+    def _flush_batch(self) -> None:
+        """Send the commands buffered by `batch()` as one compound command."""
+        if self._batch:
+            messages, self._batch = self._batch, []
+            self._wait_check()
+            self._write(_join_messages(messages))
 
     def command(self, message: str) -> int:
         """
         Write a VISA command without read back.
 
-        Alias of write(message).
+        Alias of write(message). Inside a `batch()` context, the message is 
+        buffered instead and 0 is returned.
 
         Args:
             message: The message to be sent.
@@ -219,7 +478,11 @@ class VisaInstrument(BaseInstrument):
         Returns:
             Number of bytes written.
         """
-        return self.write(message)
+        if self._batch is not None:
+            self._batch.append(message)
+            return 0
+        self._wait_check()
+        return self._write(message)
 
     def write(
         self,
@@ -243,7 +506,10 @@ class VisaInstrument(BaseInstrument):
         Returns:
             Number of bytes written.
         """
-        return self._inst.write(message, termination, encoding)
+        self._wait_check()
+        if self._batch:
+            self._flush_batch()
+        return self._write(message, termination, encoding)
 
     def read(
         self, termination: Optional[str] = None, encoding: Optional[str] = None
@@ -268,7 +534,10 @@ class VisaInstrument(BaseInstrument):
         Returns:
             Message read from the instrument and decoded.
         """
-        return self._inst.read(termination, encoding)
+        self._wait_check()
+        if self._batch:
+            self._flush_batch()
+        return self._read(termination, encoding)
 
     def query(self, message: str, delay: Optional[float] = None) -> str:
         """A combination of write(message) and read()
@@ -282,13 +551,47 @@ class VisaInstrument(BaseInstrument):
             Answer from the device.
 
         """
-        return self._inst.query(message, delay)
+        self._wait_check()
+        if self._batch:
+            self._flush_batch()
+        return self._query(message, delay)
+
+    def set_query_delay(self, delay: float) -> None:
+        """Set the delay between write and read operations of a query.
+
+        Args:
+            delay: Delay in seconds. The default is `VI_QUERY_DELAY`.
+        """
+        if delay < 0:
+            raise ValueError(f'Parameter delay must be non-negative, but got {delay!r}')
+        self._inst.query_delay = delay
+
+    def multi_query(
+        self, messages: Sequence[str], delay: Optional[float] = None
+    ) -> List[str]:
+        """Send several queries as one compound query and split the answers.
+
+        The queries are joined with the SCPI compound separator `;:` (`;` 
+        before common commands), so the instrument answers all of them in a 
+        single reply, separated by `;`. This costs one VISA round trip 
+        instead of one per query.
+
+        Args:
+            messages: The queries to send.
+            delay: Delay in seconds between write and read operations. If 
+                None, defaults to query_delay passed to `__init__` method.
+
+        Returns:
+            The answers of the queries, in the same order as `messages`.
+        """
+        reply = self.query(_join_messages(messages), delay)
+        return _REPLY_SEPARATOR_RE.split(reply.strip())
 
     def read_binary_values(
         self,
         datatype: pyvisa.util.BINARY_DATATYPES = "f",
         is_big_endian: bool = False,
-        container: Type | Callable[[Iterable], Sequence] = list,
+        container: Optional[Type | Callable[[Iterable], Sequence]] = None,
         header_fmt: pyvisa.util.BINARY_HEADERS = "ieee",
         expect_termination: bool = True,
         data_points: int = 0,
@@ -303,7 +606,9 @@ class VisaInstrument(BaseInstrument):
             is_big_endian: Are the data in big or little endian order. 
                 Defaults to False.
             container: Container type to use for the output data. Possible 
-                values are: list, tuple, np.ndarray, etc, Default to list.
+                values are: list, tuple, np.ndarray, etc. If None, 
+                np.ndarray is used. Defaults to None. Note: the default was 
+                list before; pass `container=list` for the old behavior.
             header_fmt: Format of the header prefixing the data. Defaults to 
                 'ieee'.
             expect_termination: When set to False, the expected length of the 
@@ -314,11 +619,16 @@ class VisaInstrument(BaseInstrument):
                 converted in a number of bytes based on the datatype. Defaults 
                 to 0.
             chunk_size: Size of the chunks to read from the device. Using 
-                larger chunks may be faster for large amount of data.
+                larger chunks may be faster for large amount of data. If 
+                None, `VI_BINARY_CHUNK_SIZE` is used. Defaults to None.
 
         Returns:
             Data read from the device.
         """
+        container, chunk_size = _binary_read_defaults(container, chunk_size)
+        self._wait_check()
+        if self._batch:
+            self._flush_batch()
         return self._inst.read_binary_values(
             datatype, is_big_endian, container, header_fmt, 
             expect_termination, data_points, chunk_size)
@@ -328,7 +638,7 @@ class VisaInstrument(BaseInstrument):
         message: str,
         datatype: pyvisa.util.BINARY_DATATYPES = "f",
         is_big_endian: bool = False,
-        container: Type | Callable[[Iterable], Sequence] = list,
+        container: Optional[Type | Callable[[Iterable], Sequence]] = None,
         delay: Optional[float] = None,
         header_fmt: pyvisa.util.BINARY_HEADERS = "ieee",
         expect_termination: bool = True,
@@ -345,7 +655,9 @@ class VisaInstrument(BaseInstrument):
             is_big_endian: Are the data in big or little endian order. 
                 Defaults to False.
             container: Container type to use for the output data. Possible 
-                values are: list, tuple, np.ndarray, etc, Default to list.
+                values are: list, tuple, np.ndarray, etc. If None, 
+                np.ndarray is used. Defaults to None. Note: the default was 
+                list before; pass `container=list` for the old behavior.
             delay: Delay in seconds between write and read operations. If 
                 None, defaults to query_delay passed to `__init__` method.
             header_fmt: Format of the header prefixing the data. Defaults to 
@@ -358,16 +670,182 @@ class VisaInstrument(BaseInstrument):
                 converted in a number of bytes based on the datatype. Defaults 
                 to 0.
             chunk_size: Size of the chunks to read from the device. Using 
-                larger chunks may be faster for large amount of data.
+                larger chunks may be faster for large amount of data. If 
+                None, `VI_BINARY_CHUNK_SIZE` is used. Defaults to None.
 
         Returns:
             Data read from the device.
 
         """
+        container, chunk_size = _binary_read_defaults(container, chunk_size)
+        self._wait_check()
+        if self._batch:
+            self._flush_batch()
         return self._inst.query_binary_values(
             message, datatype, is_big_endian, container, delay, 
             header_fmt, expect_termination, data_points, chunk_size)
 
+    def write_raw(self, message: bytes) -> int:
+        """Write a byte message to the device.
+
+        No termination is appended and no encoding is applied.
+
+        Args:
+            message: The message to be sent.
+
+        Returns:
+            Number of bytes written.
+        """
+        self._wait_check()
+        if self._batch:
+            self._flush_batch()
+        return self._inst.write_raw(message)
+
+    def read_bytes(
+        self, 
+        count: int, 
+        chunk_size: Optional[int] = None, 
+        break_on_termchar: bool = False,
+    ) -> bytes:
+        """Read a certain number of bytes from the device, without decoding.
+
+        Args:
+            count: The number of bytes to read.
+            chunk_size: Size of the chunks to read from the device. If None, 
+                the chunk_size passed to `__init__` method is used. Defaults 
+                to None.
+            break_on_termchar: Should the reading stop when a termination 
+                character is encountered. Defaults to False.
+
+        Returns:
+            Bytes read from the instrument.
+        """
+        self._wait_check()
+        if self._batch:
+            self._flush_batch()
+        return self._inst.read_bytes(
+            count, chunk_size=chunk_size, break_on_termchar=break_on_termchar)
+
+    def read_raw_binary(
+        self, 
+        n_bytes: Optional[int] = None, 
+        dtype: str = '>i2', 
+        chunk_size: Optional[int] = None,
+    ) -> np.ndarray:
+        """Read a definite length IEEE binary block into a numpy array.
+
+        The payload bytes are reinterpreted in place with `numpy.frombuffer`, 
+        without decoding, per-sample conversion or copy. The returned array 
+        is read-only.
+
+        If the payload size is known, the length of the `#NLLLL` header is 
+        known too, so the whole block (with the read termination) is read in 
+        one call. Otherwise the header is read and parsed first, then the 
+        payload is read in one call.
+
+        If the header is not as expected, the device buffers are cleared 
+        before raising, so the rest of the block does not corrupt the next 
+        read.
+
+        Args:
+            n_bytes: Number of bytes of the payload, excluding the header. If 
+                None, it is parsed from the header. Defaults to None.
+            dtype: numpy dtype of a single element. Defaults to big-endian 
+                int16.
+            chunk_size: Size of the chunks to read from the device. If None, 
+                `VI_BINARY_CHUNK_SIZE` is used. Defaults to None.
+
+        Returns:
+            Data read from the device.
+
+        Raises:
+            [InstrIOError][pyinst.errors.InstrIOError]
+        """
+        import numpy as np
+
+        dtype = np.dtype(dtype)
+        chunk_size = chunk_size or VI_BINARY_CHUNK_SIZE
+        termination = self._inst.read_termination or ''
+        if n_bytes is None:
+            header = self.read_bytes(2)
+            if header[:1] != b'#' or not b'1' <= header[1:2] <= b'9':
+                self._inst.clear()
+                raise InstrIOError(f'Unexpected binary block header: {header!r}')
+            n_bytes = int(self.read_bytes(int(header[1:2])))
+            header_len = 0
+            buf = self.read_bytes(n_bytes + len(termination), chunk_size)
+        else:
+            digits = str(n_bytes)
+            header = f'#{len(digits):d}{digits}'.encode()
+            header_len = len(header)
+            buf = self.read_bytes(
+                header_len + n_bytes + len(termination), chunk_size)
+            if buf[:header_len] != header:
+                self._inst.clear()
+                raise InstrIOError(f'Unexpected binary block header: {buf[:header_len]!r}')
+        return np.frombuffer(
+            buf, dtype=dtype, count=n_bytes // dtype.itemsize, offset=header_len)
+
+    async def _run_in_thread(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run a blocking I/O function in the default executor of the event 
+        loop.
+
+        The asynchronous (`a*`) methods of an instance are serialized with a 
+        lock, so concurrent coroutines do not interleave the messages on the 
+        same session, while different instances run concurrently. The 
+        synchronous methods do not take the lock: do not call them from 
+        another thread while asynchronous calls on the same instance are 
+        pending.
+        """
+        import asyncio
+
+        def locked_call():
+            with self._io_lock:
+                return func(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, locked_call)
+
+    async def awrite(self, message: str, **kwargs: Any) -> int:
+        """Asynchronous version of `write`, run in a worker thread.
+
+        Args:
+            message: The message to be sent.
+            **kwargs: Directly passed to `write`.
+
+        Returns:
+            Number of bytes written.
+        """
+        return await self._run_in_thread(self.write, message, **kwargs)
+
+    async def aquery(self, message: str, delay: Optional[float] = None) -> str:
+        """Asynchronous version of `query`, run in a worker thread.
+
+        Blocking VISA calls of different instruments overlap, e.g.:
+
+            >>> await asyncio.gather(scope_a.aquery('*IDN?'), scope_b.aquery('*IDN?'))
+
+        Args:
+            message: The message to send.
+            delay: Delay in seconds between write and read operations. If 
+                None, defaults to query_delay passed to `__init__` method.
+
+        Returns:
+            Answer from the device.
+        """
+        return await self._run_in_thread(self.query, message, delay)
+
+    async def aread_binary(self, **kwargs: Any) -> Sequence[int | float]:
+        """Asynchronous version of `read_binary_values`, run in a worker 
+        thread.
+
+        Args:
+            **kwargs: Directly passed to `read_binary_values`.
+
+        Returns:
+            Data read from the device.
+        """
+        return await self._run_in_thread(self.read_binary_values, **kwargs)
+
     def set_visa_attribute(
         self, name: pyvisa.constants.ResourceAttribute, state: Any
     ) -> pyvisa.constants.StatusCode:
@@ -402,12 +880,60 @@ class VisaInstrument(BaseInstrument):
 
 class ModelMDO34(VisaInstrument):
 
+    __slots__ = ()
+
     brand = 'Tektronix'
 
     model = "MDO34"
 
     CH_NUMS = (1, 2, 3, 4)
 
+    _CH_NUMS_SET = frozenset(CH_NUMS)
+
+    # Per-channel command templates, indexed by the channel number
+
+    _CMD_LABEL_SET = {n: f'CH{n:d}:LABel {{}}' for n in CH_NUMS}
+
+    _CMD_LABEL_GET = {n: f'CH{n:d}:LABel?' for n in CH_NUMS}
+
+    _CMD_COUPLING_SET = {n: f'CH{n:d}:COUPling {{}}' for n in CH_NUMS}
+
+    _CMD_COUPLING_GET = {n: f'CH{n:d}:COUPling?' for n in CH_NUMS}
+
+    _CMD_BANDWIDTH_SET = {n: f'CH{n:d}:BANdwidth {{:.4E}}' for n in CH_NUMS}
+
+    _CMD_BANDWIDTH_GET = {n: f'CH{n:d}:BANdwidth?' for n in CH_NUMS}
+
+    _CMD_SCALE_SET = {n: f'CH{n:d}:SCAle {{:.3E}}' for n in CH_NUMS}
+
+    _CMD_SCALE_GET = {n: f'CH{n:d}:SCAle?' for n in CH_NUMS}
+
+    _CMD_POSITION_SET = {n: f'CH{n:d}:POSition {{:.3f}}' for n in CH_NUMS}
+
+    _CMD_POSITION_GET = {n: f'CH{n:d}:POSition?' for n in CH_NUMS}
+
+    # numeric answers first, label last since it may contain ';'
+    _CMD_SETTINGS_GET = {n: SCPI_COMPOUND_SEPARATOR.join((
+        f'CH{n:d}:SCAle?', f'CH{n:d}:POSition?', f'CH{n:d}:BANdwidth?', 
+        f'CH{n:d}:COUPling?', f'CH{n:d}:LABel?')) for n in CH_NUMS}
+
+    _CMD_WFM_SCALING_GET = SCPI_COMPOUND_SEPARATOR.join((
+        'WFMOutpre:NR_Pt?', 'WFMOutpre:YMUlt?', 'WFMOutpre:YOFf?', 
+        'WFMOutpre:YZEro?', 'WFMOutpre:XINcr?', 'WFMOutpre:XZEro?'))
+
+    _CMD_WAVEFORM_GET = {
+        n: f'DATa:SOUrce CH{n:d};:DATa:ENCdg RIBinary;:CURVe?' for n in CH_NUMS}
+
+    _CMD_WFM_SETUP = {
+        n: f'DATa:SOUrce CH{n:d};:DATa:ENCdg RIBinary;:WFMOutpre:BYT_Nr 2' 
+        for n in CH_NUMS}
+
+    _CMD_CURVE_GET = {n: f'DATa:SOUrce CH{n:d};:CURVe?' for n in CH_NUMS}
+
+    _CMD_TRIGGER_LEVEL_SET = {n: f'TRIGger:A:LEVel:CH{n:d} {{:.4E}}' for n in CH_NUMS}
+
+    _CMD_TRIGGER_LEVEL_GET = {n: f'TRIGger:A:LEVel:CH{n:d}?' for n in CH_NUMS}
+
     def __init__(self, resource_name: str, **kwargs: Any):
         super().__init__(resource_name, **kwargs)
 
@@ -422,9 +948,26 @@ class ModelMDO34(VisaInstrument):
         Raises:
             ValueError
         """
-        if ch_num not in self.CH_NUMS:
+        if ch_num not in self._CH_NUMS_SET:
             raise ValueError(f"Invalid ch_num: {ch_num!r}")
 
+    def _get_ch_cmd(self, cmds: Dict[int, Any], ch_num: int) -> Any:
+        """
+        Get the command template of a channel. If the channel number is not 
+        valid, an ValueError will be raised.
+
+        Args:
+            cmds: The command templates, indexed by the channel number.
+            ch_num: The channel number.
+
+        Raises:
+            ValueError
+        """
+        try:
+            return cmds[ch_num]
+        except (KeyError, TypeError):
+            raise ValueError(f"Invalid ch_num: {ch_num!r}") from None
+
     def _disable_response_header(self) -> None:
         """Disable the header in the responsed message of a query operation."""
         cmd = ":HDR OFF"
@@ -438,11 +981,10 @@ class ModelMDO34(VisaInstrument):
             ch_num: The number of the channel. Valid values are: `1` | `2` | `3` | `4`
             label: The label of the channel. Limited to 30 characters
         """
-        self._check_ch_num(ch_num)
-        if not isinstance(label, str) or len(label) > 30:
-            raise ValueError(f'Parameter label must be a str limited to 30 characters, but got {label!r}')
-        cmd = f'CH{ch_num:d}:LABel "{label}"'
-        self.command(cmd)
+        cmd = self._get_ch_cmd(self._CMD_LABEL_SET, ch_num)
+        if type(label) is not str or len(label) > _MAX_LABEL:
+            raise ValueError(f'Parameter label must be a str limited to {_MAX_LABEL} characters, but got {label!r}')
+        self.command(cmd.format(_quote(label)))
     
     def get_channel_label(self, ch_num: int) -> str:
         """Get the waveform label for a channel.
@@ -453,9 +995,53 @@ class ModelMDO34(VisaInstrument):
         Returns:
             The label of the channel. Limited to 30 characters.
         """
-        self._check_ch_num(ch_num)
-        cmd = f'CH{ch_num:d}:LABel?'
-        return self.query(cmd).strip().strip('"')
+        cmd = self._get_ch_cmd(self._CMD_LABEL_GET, ch_num)
+        return _unquote(self.query(cmd))
+
+    def get_channel_settings(self, ch_num: int) -> Dict[str, Any]:
+        """Get the label, scale, position, coupling and bandwidth of a 
+        channel with one compound query.
+
+        Args:
+            ch_num: The number of the channel. Valid values are: `1` | `2` | `3` | `4`
+
+        Returns:
+            A dict with keys `label`, `scale`, `position`, `coupling` and 
+            `bandwidth`. Refer to the corresponding getters for the meaning 
+            of the values.
+        """
+        cmd = self._get_ch_cmd(self._CMD_SETTINGS_GET, ch_num)
+        reply = self.query(cmd)
+        fields = reply.split(';', 4)
+        if len(fields) != 5:
+            raise ValueError(f'Invalid channel settings reply: {reply!r}')
+        scale, position, bandwidth = _parse_floats(reply, count=3)
+        coupling, label = fields[3:]
+        return {
+            'label': _unquote(label),
+            'scale': float(scale),
+            'position': float(position),
+            'coupling': coupling.strip().upper(),
+            'bandwidth': float(bandwidth),
+        }
+
+    async def aget_channel_settings(self, ch_num: int) -> Dict[str, Any]:
+        """Asynchronous version of `get_channel_settings`, run in a worker 
+        thread.
+
+        Channels of the same instrument are queried one after another on 
+        its session, while different instruments are queried concurrently:
+
+            >>> await asyncio.gather(*(
+            ...     scope.aget_channel_settings(ch) for scope in scopes for ch in scope.CH_NUMS))
+
+        Args:
+            ch_num: The number of the channel. Valid values are: `1` | `2` | `3` | `4`
+
+        Returns:
+            Refer to `get_channel_settings`.
+        """
+        return await self._run_in_thread(self.get_channel_settings, ch_num)
 
     def set_channel_coupling(self, ch_num: int, coupling: str):
         """Specifies the input attenuator coupling setting for a channel.
@@ -464,11 +1050,10 @@ class ModelMDO34(VisaInstrument):
             ch_num: The number of the channel. Valid values are: `1` | `2` | `3` | `4`
             coupling: The attenuator coupling setting. Options are: `AC`, `DC`, `DCREJECT`
         """
-        self._check_ch_num(ch_num)
-        if not coupling in {'AC', 'DC', 'DCREJECT'}:
+        cmd = self._get_ch_cmd(self._CMD_COUPLING_SET, ch_num)
+        if coupling not in _CH_COUPLINGS:
             raise ValueError(f'Invalid coupling: {coupling!r}')
-        cmd = f'CH{ch_num:d}:COUPling {coupling}'
-        self.command(cmd)
+        self.command(cmd.format(coupling))
 
     def get_channel_coupling(self, ch_num: int) -> str:
         """Queries the specified input attenuator coupling setting for a channel.
@@ -479,21 +1064,18 @@ class ModelMDO34(VisaInstrument):
         Returns:
             The attenuator coupling setting.
         """
-        self._check_ch_num(ch_num)
-        cmd = f'CH{ch_num:d}:COUPling?'
+        cmd = self._get_ch_cmd(self._CMD_COUPLING_GET, ch_num)
         return self.query(cmd).strip().upper()
 
     def set_channel_bandwidth(self, ch_num: int, bandwidth: int | float) -> None:
         """"""
-        self._check_ch_num(ch_num)
+        cmd = self._get_ch_cmd(self._CMD_BANDWIDTH_SET, ch_num)
         if bandwidth <= 0:
             raise ValueError(f'Parameter bandwidth must be a positive float, but got {bandwidth!r}')
-        cmd = f'CH{ch_num:d}:BANdwidth {bandwidth:.4E}'
-        self.command(cmd)
+        self.command(cmd.format(bandwidth))
 
     def get_channel_bandwidth(self, ch_num: int) -> float:
-        self._check_ch_num(ch_num)
-        cmd = f'CH{ch_num:d}:BANdwidth?'
+        cmd = self._get_ch_cmd(self._CMD_BANDWIDTH_GET, ch_num)
         bw = float(self.query(cmd))
         return bw
 
@@ -505,11 +1087,10 @@ class ModelMDO34(VisaInstrument):
             scale: The vertical channel scale in units-per-division. The unit is V. 
                 The value entered here is truncated to three significant digits.
         """
-        self._check_ch_num(ch_num)
+        cmd = self._get_ch_cmd(self._CMD_SCALE_SET, ch_num)
         if scale <= 0:
             raise ValueError(f'Parameter scale must be a positive float, but got {scale!r}')
-        cmd = f'CH{ch_num:d}:SCAle {scale:.3E}'
-        self.command(cmd)
+        self.command(cmd.format(scale))
 
     def get_channel_scale(self, ch_num: int) -> float:
         """Queries the vertical scale for the specified channel. 
@@ -520,8 +1101,7 @@ class ModelMDO34(VisaInstrument):
         Returns:
             The vertical channel scale in units-per-division. The unit is V.
         """
-        self._check_ch_num(ch_num)
-        cmd = f'CH{ch_num:d}:SCAle?'
+        cmd = self._get_ch_cmd(self._CMD_SCALE_GET, ch_num)
         scale = float(self.query(cmd))
         return scale
 
@@ -532,11 +1112,10 @@ class ModelMDO34(VisaInstrument):
             ch_num: The number of the channel. Valid values are: `1` | `2` | `3` | `4`
             position: The position value in divisions, from the center graticule. The range is 8 to -8 divisions.
         """
-        self._check_ch_num(ch_num)
-        if not -8 <= position <= 8:
+        cmd = self._get_ch_cmd(self._CMD_POSITION_SET, ch_num)
+        if not _CH_POSITION_MIN <= position <= _CH_POSITION_MAX:
             raise ValueError(f'Parameter position must be between -8 and 8, but got {position!r}')
-        cmd = f'CH{ch_num:d}:POSition {position:.3f}'
-        self.command(cmd)
+        self.command(cmd.format(position))
 
     def get_channel_position(self, ch_num: int) -> float:
         """Queries the vertical positon of the channel.
@@ -547,11 +1126,88 @@ class ModelMDO34(VisaInstrument):
         Returns:
             The position value in divisions, from the center graticule. The range is 8 to -8 divisions.
         """
-        self._check_ch_num(ch_num)
-        cmd = f'CH{ch_num:d}:POSition?'
+        cmd = self._get_ch_cmd(self._CMD_POSITION_GET, ch_num)
         position = float(self.query(cmd))
         return position
 
+    def get_waveform(self, ch_num: int) -> np.ndarray:
+        """Get the waveform samples of a channel as raw ADC codes.
+
+        The data is transferred in signed big-endian binary format, and is 
+        not converted to float. Use the `WFMOutpre` parameters to scale the 
+        codes into volts.
+
+        Args:
+            ch_num: The number of the channel. Valid values are: `1` | `2` | `3` | `4`
+
+        Returns:
+            The waveform samples, as an `int8` or `int16` array depending on 
+            `WFMOutpre:BYT_Nr`.
+        """
+        cmd = self._get_ch_cmd(self._CMD_WAVEFORM_GET, ch_num)
+        datatype = 'b' if int(self.query('WFMOutpre:BYT_Nr?')) == 1 else 'h'
+        return self.query_binary_values(cmd, datatype=datatype, is_big_endian=True)
+
+    def get_scaled_waveform(self, ch_num: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the waveform of a channel scaled into time and volts.
+
+        The samples are transferred as 16-bit ADC codes with a single raw 
+        read, then scaled with the `WFMOutpre` parameters in one vectorized 
+        numpy expression.
+
+        Args:
+            ch_num: The number of the channel. Valid values are: `1` | `2` | `3` | `4`
+
+        Returns:
+            A tuple of `(t, volts)`. `t` is a `float64` array in seconds, 
+            since `float32` cannot resolve sub-ns sample spacing at ms 
+            offsets. `volts` is a `float32` array.
+        """
+        import numpy as np
+
+        cmd = self._get_ch_cmd(self._CMD_WFM_SETUP, ch_num)
+        # write, not command: the setup must not be deferred by batch()
+        self.write(cmd)
+        n, ymult, yoff, yzero, xincr, xzero = _parse_floats(
+            self.query(self._CMD_WFM_SCALING_GET), count=6).tolist()
+        self.write('CURVe?')
+        raw = self.read_raw_binary(int(n) * 2, '>i2')
+        volts = (raw.astype(np.float32) - yoff) * ymult + yzero
+        t = np.arange(raw.size) * xincr + xzero
+        return t, volts
+
+    def get_waveforms(self, chs: Sequence[int]) -> Dict[int, np.ndarray]:
+        """Get the waveforms of several channels from the same acquisition 
+        as raw ADC codes.
+
+        The acquisition is stopped (and left stopped) so all the channels 
+        come from the same acquisition. The record length is queried once 
+        for all the channels, then each channel is selected and read with 
+        one compound query. The `WFMOutpre` scaling parameters differ 
+        between channels, so the codes are not scaled here.
+
+        Args:
+            chs: The numbers of the channels. Valid values are: `1` | `2` | `3` | `4`
+
+        Returns:
+            The `int16` samples indexed by channel number. They are the rows 
+            of one contiguous `(len(chs), n)` array, so they can be scaled 
+            together.
+        """
+        import numpy as np
+
+        cmds = [self._get_ch_cmd(self._CMD_CURVE_GET, ch) for ch in chs]
+        if not cmds:
+            return {}
+        # write, not command: the setup must not be deferred by batch()
+        self.write('ACQuire:STATE STOP;:' + self._CMD_WFM_SETUP[chs[0]])
+        n = int(self.query('WFMOutpre:NR_Pt?'))
+        data = np.empty((len(cmds), n), dtype=np.int16)
+        for row, cmd in zip(data, cmds):
+            self.write(cmd)
+            row[:] = self.read_raw_binary(n * 2, '>i2')
+        return dict(zip(chs, data))
+
     def set_math_channel_type(self, num: int, math_type: str) -> None:
         """Specifies the math type.
         
@@ -559,7 +1215,7 @@ class ModelMDO34(VisaInstrument):
             num: The number of the math channel.
             math_type: The math type. Valid values are: `DUAL` | `FFT` | `ADVANCED` | `SPECTRUM`
         """
-        if math_type not in {'DUAL', 'FFT', 'ADVANCED', 'SPECTRUM'}:
+        if math_type not in _MATH_TYPES:
             raise ValueError(f'Invalid value for math_type: {math_type}')
         cmd = f'MATH{num:d}:TYPe {math_type}'
         self.command(cmd)
@@ -583,7 +1239,7 @@ class ModelMDO34(VisaInstrument):
             num: The number of the math channel.
             function: The function definition.
         """
-        cmd = f'MATH{num}:DEFine "{function}"'
+        cmd = f'MATH{num:d}:DEFine {_quote(function)}'
         self.command(cmd)
 
     def get_math_channel_function(self, num: int) -> str:
@@ -596,7 +1252,7 @@ class ModelMDO34(VisaInstrument):
             The function definition.
         """
         cmd = f'MATH{num:d}:DEFine?'
-        return self.query(cmd).strip().strip('"')
+        return _unquote(self.query(cmd))
     
     def set_x_scale(self, scale: int | float) -> None:
         """Specifies the time base horizontal scale.
@@ -604,9 +1260,10 @@ class ModelMDO34(VisaInstrument):
         Args:
             scale: The horizontal scale in seconds.
         """
-        if not 400 * 10E-12 <= scale <= 1000:
-            raise ValueError(f'Parameter scale must be between 400 * 10E-12 (400 ps) and 1000, but got {scale!r}')
+        if not _X_SCALE_MIN <= scale <= _X_SCALE_MAX:
+            raise ValueError(f'Parameter scale must be between 400E-12 (400 ps) and 1000, but got {scale!r}')
         cmd = f'HORizontal:SCAle {scale:.4E}'
+        self.command(cmd)
 
     def get_x_scale(self) -> float:
         """Queries the time base horizontal scale.
@@ -624,7 +1281,7 @@ class ModelMDO34(VisaInstrument):
         Args:
             position: The horisontal position in percent.
         """
-        if not 0 <= position <= 100:
+        if not _X_POSITION_MIN <= position <= _X_POSITION_MAX:
             raise ValueError(f'Parameter position must be between 0 and 100, but got {position!r}.')
         cmd = f'HORizontal:POSition {position!r}'
         self.command(cmd)
@@ -646,7 +1303,7 @@ class ModelMDO34(VisaInstrument):
         Args:
             trigger_type: `EDGE` | `LOGIC` | `PULSE` | `BUS` | `VIDEO`
         """
-        if not trigger_type in {'EDGE', 'LOGIC', 'PULSE', 'BUS', 'VIDEO'}:
+        if trigger_type not in _TRIGGER_TYPES:
             raise ValueError(f'Invalid trigger_type: {trigger_type!r}')
         cmd = f'TRIGger:A:TYPe {trigger_type}'
         self.command(cmd)
@@ -667,7 +1324,7 @@ class ModelMDO34(VisaInstrument):
         Args:
             coupling: Options are `AC`, `DC`, `HFREJ`, `LFREJ`, `NOISEREJ`
         """
-        if not coupling in {'AC', 'DC', 'HFREJ', 'LFREJ', 'NOISEREJ'}:
+        if coupling not in _TRIGGER_EDGE_COUPLINGS:
             raise ValueError(f'Invalid coupling: {coupling!r}')
         cmd = f'TRIGger:A:EDGE:COUPling {coupling}'
         self.command(cmd)
@@ -688,7 +1345,7 @@ class ModelMDO34(VisaInstrument):
         Args:
             slope: The slope for the A edge trigger, options are: `RISE` | `FALL` | `EITHER`
         """
-        if not slope in {'RISE', 'FALL', 'EITHER'}:
+        if slope not in _TRIGGER_EDGE_SLOPES:
             raise ValueError(f'Invalid value for slope: {slope!r}')
         cmd = 'TRIGger:A:EDGE:SLOpe {slope}'
         self.command(cmd)
@@ -709,7 +1366,7 @@ class ModelMDO34(VisaInstrument):
         Args:
             src: The source for the A edge trigger, options are: `CH1` | `CH2` | `CH3` | `CH4`
         """
-        if not src in {'CH1', 'CH2', 'CH3', 'CH4'}:
+        if src not in _TRIGGER_EDGE_SOURCES:
             raise ValueError(f'Invalid value for src: {src!r}')
         cmd = f'TRIGger:A:EDGE:SOUrce {src}'
         self.command(cmd)
@@ -732,9 +1389,8 @@ class ModelMDO34(VisaInstrument):
             ch_num: The number of the channel. Valid values are: `1` | `2` | `3` | `4`
             level: The trigger threshold level in Volts.
         """
-        self._check_ch_num(ch_num)
-        cmd = f'TRIGger:A:LEVel:CH{ch_num:d} {level:.4E}'
-        self.command(cmd)
+        cmd = self._get_ch_cmd(self._CMD_TRIGGER_LEVEL_SET, ch_num)
+        self.command(cmd.format(level))
 
     def get_trigger_a_level(self, ch_num: int) -> float:
         """Queries the threshold voltage level to use for trigger when triggering 
@@ -747,7 +1403,7 @@ class ModelMDO34(VisaInstrument):
         Returns:
             The trigger threshold level in Volts.
         """
-        cmd = f'TRIGger:A:LEVel:CH{ch_num:d}?'
+        cmd = self._get_ch_cmd(self._CMD_TRIGGER_LEVEL_GET, ch_num)
         level = float(self.query(cmd))
         return level
 
@@ -1,5 +1,433 @@
+import asyncio
+import struct
+import threading
+
+import numpy as np
+import pytest
+import pyvisa.constants
+import pyvisa.errors
+import pyvisa.util
+
 from tek_mdo import __version__
+from tek_mdo import main
+from tek_mdo.main import ModelMDO34, VisaInstrument
+
+
+class StubResource:
+    """Stand-in for a pyvisa message based resource, which records the
+    messages written and answers queries from a dict."""
+
+    read_termination = '\n'
+
+    def __init__(self, replies=None, data=b''):
+        self.written = []
+        self.replies = {'*IDN?': 'TEKTRONIX,MDO34,C000000,CF:91.1CT FV:v1.0'}
+        self.replies.update(replies or {})
+        self.data = data
+        self.cleared = False
+        self.closed = False
+        self.query_delay = 0.0
+        self.resource_info_reads = 0
+
+    @property
+    def resource_info(self):
+        self.resource_info_reads += 1
+        return ('TCPIP', 'INSTR')
+
+    def write(self, message, termination=None, encoding=None):
+        self.written.append(message)
+        return len(message)
+
+    def read(self, termination=None, encoding=None):
+        return ''
+
+    def query(self, message, delay=None):
+        self.written.append(message)
+        reply = self.replies[message]
+        if isinstance(reply, Exception):
+            raise reply
+        return reply() if callable(reply) else reply
+
+    def query_binary_values(self, message, datatype='f', is_big_endian=False,
+                            container=list, *args):
+        self.written.append(message)
+        return pyvisa.util.from_ieee_block(
+            self.data, datatype, is_big_endian, container)
+
+    def read_binary_values(self, datatype='f', is_big_endian=False,
+                           container=list, *args):
+        return pyvisa.util.from_ieee_block(
+            self.data, datatype, is_big_endian, container)
+
+    def write_raw(self, message):
+        self.written.append(message)
+        return len(message)
+
+    def read_bytes(self, count, chunk_size=None, break_on_termchar=False):
+        chunk, self.data = self.data[:count], self.data[count:]
+        return chunk
+
+    def clear(self):
+        self.cleared = True
+        self.data = b''
+
+    def close(self):
+        self.closed = True
+
+
+class StubResourceManager:
+
+    def __init__(self, resource):
+        self.resource = resource
+
+    def open_resource(self, resource_name, **kwargs):
+        return self.resource
+
+
+@pytest.fixture
+def resource(monkeypatch):
+    res = StubResource()
+    # restore the shared resource manager after the test
+    monkeypatch.setattr(main, '_RM', main._RM)
+    VisaInstrument.set_resource_manager(StubResourceManager(res))
+    return res
+
+
+@pytest.fixture
+def scope(resource):
+    instance = ModelMDO34('TCPIP::stub::INSTR')
+    resource.written.clear()
+    return instance
 
 
 def test_version():
     assert __version__ == '0.1.0'
+
+
+def test_idn_and_resource_info_are_cached(scope, resource):
+    idn = resource.replies['*IDN?']
+    assert scope.idn == idn
+    assert scope.idn == idn
+    assert resource.written == []
+    assert scope.resource_info == scope.resource_info == ('TCPIP', 'INSTR')
+    assert resource.resource_info_reads == 1
+
+
+def test_idn_is_queried_once(monkeypatch, resource):
+    # without the communication check, the first access queries the IDN
+    monkeypatch.setattr(VisaInstrument, '_check_communication', lambda self: None)
+    scope = ModelMDO34('TCPIP::stub::INSTR')
+    for _ in range(3):
+        assert scope.idn == resource.replies['*IDN?']
+    assert resource.written == ['*IDN?']
+
+
+def test_batch_joins_commands(scope, resource):
+    with scope.batch():
+        scope.set_channel_scale(1, 0.5)
+        scope.command(':HDR OFF')
+        scope.set_channel_position(2, 1)
+        assert resource.written == []
+    assert resource.written == ['CH1:SCAle 5.000E-01;:HDR OFF;:CH2:POSition 1.000']
+
+
+def test_batch_joins_common_commands_without_colon(scope, resource):
+    with scope.batch():
+        scope.set_channel_scale(1, 1)
+        scope.cls()
+        scope.set_channel_scale(2, 1)
+    assert resource.written == [
+        'CH1:SCAle 1.000E+00;*CLS;:CH2:SCAle 1.000E+00']
+
+
+def test_batch_flushes_before_other_io(scope, resource):
+    resource.replies['CH1:SCAle?'] = '5.0E-1'
+    with scope.batch():
+        scope.set_channel_scale(1, 0.5)
+        assert scope.get_channel_scale(1) == 0.5
+        scope.set_channel_position(1, 0)
+    assert resource.written == [
+        'CH1:SCAle 5.000E-01', 'CH1:SCAle?', 'CH1:POSition 0.000']
+
+
+def test_batch_discards_commands_on_error(scope, resource):
+    with pytest.raises(RuntimeError):
+        with scope.batch():
+            scope.set_channel_scale(1, 0.5)
+            raise RuntimeError
+    assert resource.written == []
+
+
+def test_multi_query_splits_outside_quotes(scope, resource):
+    resource.replies['CH1:LABel?;:HDR?;:CH2:LABel?'] = '"a;b";0;"say ""x;"""'
+    assert scope.multi_query(['CH1:LABel?', ':HDR?', 'CH2:LABel?']) == [
+        '"a;b"', '0', '"say ""x;"""']
+
+
+def test_multi_query_joins_common_commands_without_colon(scope, resource):
+    resource.replies['CH1:SCAle?;*OPC?'] = '1.0E0;1'
+    assert scope.multi_query(['CH1:SCAle?', '*OPC?']) == ['1.0E0', '1']
+
+
+def test_get_channel_settings(scope, resource):
+    resource.replies[
+        'CH2:SCAle?;:CH2:POSition?;:CH2:BANdwidth?;:CH2:COUPling?;:CH2:LABel?'
+    ] = '1.0E-1;-2.5;2.0E8;dc;"a;b"'
+    assert scope.get_channel_settings(2) == {
+        'label': 'a;b',
+        'scale': 0.1,
+        'position': -2.5,
+        'coupling': 'DC',
+        'bandwidth': 2e8,
+    }
+    with pytest.raises(ValueError):
+        scope.get_channel_settings(5)
+
+
+def test_get_channel_settings_invalid_reply(scope, resource):
+    cmd = 'CH1:SCAle?;:CH1:POSition?;:CH1:BANdwidth?;:CH1:COUPling?;:CH1:LABel?'
+    resource.replies[cmd] = '1.0E-1;abc;2.0E8;DC;"x"'
+    with pytest.raises(ValueError, match='abc'):
+        scope.get_channel_settings(1)
+    resource.replies[cmd] = '1.0E-1;0;2.0E8'
+    with pytest.raises(ValueError, match='2.0E8'):
+        scope.get_channel_settings(1)
+
+
+@pytest.mark.parametrize('reply, count, expected', [
+    ('1.0;-2.5E-3;3', -1, [1.0, -2.5e-3, 3.0]),
+    ('1.0;-2;DC;"a;b"', 2, [1.0, -2.0]),
+    ('7', -1, [7.0]),
+])
+def test_parse_floats(reply, count, expected):
+    assert main._parse_floats(reply, count=count).tolist() == expected
+
+
+@pytest.mark.parametrize('reply, count', [
+    ('1.0;abc;3', -1),
+    ('1.0;abc;3', 3),
+    ('1.0;2', 3),
+    ('', -1),
+])
+def test_parse_floats_invalid(reply, count):
+    with pytest.raises(ValueError, match='Invalid numeric reply'):
+        main._parse_floats(reply, count=count)
+
+
+def _block(values, header=None):
+    """IEEE definite length block of big-endian int16 values."""
+    payload = struct.pack(f'>{len(values)}h', *values)
+    if header is None:
+        header = f'#{len(str(len(payload)))}{len(payload)}'.encode()
+    return header + payload + b'\n'
+
+
+def test_read_raw_binary_known_size(scope, resource):
+    resource.data = _block([10, -20, 300, 0])
+    assert scope.read_raw_binary(8).tolist() == [10, -20, 300, 0]
+    assert resource.data == b''
+
+
+@pytest.mark.parametrize('header', [b'#19', b'#08', b'$18'])
+def test_read_raw_binary_known_size_bad_header(scope, resource, header):
+    resource.data = _block([10, -20, 300, 0], header) + b'leftover'
+    with pytest.raises(main.InstrIOError):
+        scope.read_raw_binary(8)
+    assert resource.cleared
+    assert resource.data == b''
+
+
+def test_read_raw_binary_parses_header(scope, resource):
+    values = list(range(-3, 3)) * 2
+    resource.data = _block(values)
+    assert scope.read_raw_binary().tolist() == values
+    assert resource.data == b''
+
+
+def test_read_raw_binary_rejects_indefinite_block(scope, resource):
+    resource.data = b'#0' + struct.pack('>2h', 1, 2) + b'\n'
+    with pytest.raises(main.InstrIOError):
+        scope.read_raw_binary()
+    assert resource.cleared
+
+
+def test_write_raw_and_read_bytes(scope, resource):
+    resource.data = b'\x00\x01\x02'
+    assert scope.write_raw(b'CURVe?\n') == 7
+    assert resource.written == [b'CURVe?\n']
+    assert scope.read_bytes(2) == b'\x00\x01'
+
+
+@pytest.mark.parametrize('s', ['', 'CH1', 'a;b', 'say "hi"', '""', '"'])
+def test_quote_round_trip(s):
+    assert main._unquote(main._quote(s)) == s
+
+
+def test_set_and_get_channel_label(scope, resource):
+    scope.set_channel_label(3, 'say "hi"')
+    assert resource.written == ['CH3:LABel "say ""hi"""']
+    resource.replies['CH3:LABel?'] = '"say ""hi"""'
+    assert scope.get_channel_label(3) == 'say "hi"'
+    with pytest.raises(ValueError):
+        scope.set_channel_label(3, 'x' * 31)
+
+
+def test_set_math_channel_function(scope, resource):
+    scope.set_math_channel_function(1, 'CH1+CH2')
+    assert resource.written == ['MATH1:DEFine "CH1+CH2"']
+
+
+@pytest.mark.parametrize('byt_nr, fmt, dtype', [('1', '>4b', 'i1'), ('2', '>4h', 'i2')])
+def test_get_waveform(scope, resource, byt_nr, fmt, dtype):
+    resource.replies['WFMOutpre:BYT_Nr?'] = byt_nr
+    payload = struct.pack(fmt, 1, -2, 3, -4)
+    resource.data = f'#1{len(payload)}'.encode() + payload + b'\n'
+    data = scope.get_waveform(2)
+    assert resource.written == [
+        'WFMOutpre:BYT_Nr?', 'DATa:SOUrce CH2;:DATa:ENCdg RIBinary;:CURVe?']
+    assert data.dtype.str[1:] == dtype
+    assert data.tolist() == [1, -2, 3, -4]
+    with pytest.raises(ValueError):
+        scope.get_waveform(0)
+
+
+WFM_SCALING_QUERY = (
+    'WFMOutpre:NR_Pt?;:WFMOutpre:YMUlt?;:WFMOutpre:YOFf?;:WFMOutpre:YZEro?;'
+    ':WFMOutpre:XINcr?;:WFMOutpre:XZEro?')
+
+
+def test_get_scaled_waveform(scope, resource):
+    resource.replies[WFM_SCALING_QUERY] = '4;1.0E-2;10;0.5;1.0E-9;-5.0E-3'
+    resource.data = _block([10, 20, -10, 0])
+    with scope.batch():
+        scope.set_channel_scale(3, 1)
+        t, volts = scope.get_scaled_waveform(3)
+    assert resource.written == [
+        'CH3:SCAle 1.000E+00',
+        'DATa:SOUrce CH3;:DATa:ENCdg RIBinary;:WFMOutpre:BYT_Nr 2',
+        WFM_SCALING_QUERY,
+        'CURVe?',
+    ]
+    assert volts.dtype == np.float32
+    assert volts.tolist() == pytest.approx([0.5, 0.6, 0.3, 0.4])
+    assert t.dtype == np.float64
+    assert np.diff(t) == pytest.approx([1e-9] * 3, rel=1e-6)
+    assert t[0] == -5e-3
+    with pytest.raises(ValueError):
+        scope.get_scaled_waveform(5)
+
+
+def test_get_waveforms(scope, resource):
+    resource.replies['WFMOutpre:NR_Pt?'] = '3'
+    resource.data = _block([1, 2, 3]) + _block([-1, -2, -3])
+    with scope.batch():
+        scope.set_channel_scale(1, 1)
+        waveforms = scope.get_waveforms([4, 2])
+    assert resource.written == [
+        'CH1:SCAle 1.000E+00',
+        'ACQuire:STATE STOP;:DATa:SOUrce CH4;:DATa:ENCdg RIBinary;:WFMOutpre:BYT_Nr 2',
+        'WFMOutpre:NR_Pt?',
+        'DATa:SOUrce CH4;:CURVe?',
+        'DATa:SOUrce CH2;:CURVe?',
+    ]
+    assert list(waveforms) == [4, 2]
+    assert waveforms[4].tolist() == [1, 2, 3]
+    assert waveforms[2].tolist() == [-1, -2, -3]
+    base = waveforms[4].base
+    assert base is waveforms[2].base
+    assert base.shape == (2, 3)
+    assert base.dtype == np.int16
+    assert base.flags.c_contiguous
+
+
+def test_get_waveforms_empty_and_invalid(scope, resource):
+    assert scope.get_waveforms([]) == {}
+    with pytest.raises(ValueError):
+        scope.get_waveforms([1, 5])
+    assert resource.written == []
+
+
+@pytest.mark.parametrize('scale, cmd', [
+    (400e-12, 'HORizontal:SCAle 4.0000E-10'),
+    (1e-6, 'HORizontal:SCAle 1.0000E-06'),
+    (1000, 'HORizontal:SCAle 1.0000E+03'),
+])
+def test_set_x_scale(scope, resource, scale, cmd):
+    scope.set_x_scale(scale)
+    assert resource.written == [cmd]
+
+
+@pytest.mark.parametrize('scale', [399e-12, 1001, 0, -1])
+def test_set_x_scale_out_of_range(scope, resource, scale):
+    with pytest.raises(ValueError):
+        scope.set_x_scale(scale)
+    assert resource.written == []
+
+
+def test_async_io(scope, resource):
+    resource.replies['CH1:SCAle?'] = '5.0E-1'
+    for ch in (1, 2):
+        resource.replies[
+            f'CH{ch}:SCAle?;:CH{ch}:POSition?;:CH{ch}:BANdwidth?;'
+            f':CH{ch}:COUPling?;:CH{ch}:LABel?'] = f'{ch};0;2.0E8;DC;"ch{ch}"'
+    resource.data = b'#14' + struct.pack('<2h', 7, -7) + b'\n'
+
+    async def run():
+        written = await scope.awrite('CH1:SCAle 5.000E-01')
+        scale = await scope.aquery('CH1:SCAle?')
+        settings = await asyncio.gather(
+            scope.aget_channel_settings(1), scope.aget_channel_settings(2))
+        return written, scale, settings
+
+    written, scale, settings = asyncio.run(run())
+    assert written == len('CH1:SCAle 5.000E-01')
+    assert scale == '5.0E-1'
+    assert [s['label'] for s in settings] == ['ch1', 'ch2']
+    assert [s['scale'] for s in settings] == [1.0, 2.0]
+    assert resource.written[:2] == ['CH1:SCAle 5.000E-01', 'CH1:SCAle?']
+
+    data = asyncio.run(scope.aread_binary(datatype='h'))
+    assert data.tolist() == [7, -7]
+
+
+@pytest.fixture
+def deferred(monkeypatch):
+    monkeypatch.setattr(VisaInstrument, 'DEFERRED_CHECK', True)
+
+
+def test_deferred_check_fills_idn_cache(deferred, resource):
+    scope = ModelMDO34('TCPIP::stub::INSTR')
+    assert scope.idn == resource.replies['*IDN?']
+    assert scope.idn == resource.replies['*IDN?']
+    assert resource.written == ['*IDN?']
+
+
+def test_deferred_check_failure_is_raised_on_first_io(deferred, resource):
+    resource.replies['*IDN?'] = pyvisa.errors.VisaIOError(
+        pyvisa.constants.StatusCode.error_timeout)
+    scope = ModelMDO34('TCPIP::stub::INSTR')
+    with pytest.raises(main.InstrIOError):
+        scope.query('CH1:SCAle?')
+    with pytest.raises(main.InstrIOError):
+        scope.set_channel_scale(1, 1)
+    assert resource.written == ['*IDN?']
+
+
+def test_close_waits_for_deferred_check(deferred, resource):
+    started, release = threading.Event(), threading.Event()
+
+    def idn():
+        started.set()
+        release.wait(5)
+        return 'TEKTRONIX,MDO34'
+
+    resource.replies['*IDN?'] = idn
+    scope = ModelMDO34('TCPIP::stub::INSTR')
+    assert started.wait(5)
+    closer = threading.Thread(target=scope.close)
+    closer.start()
+    closer.join(0.1)
+    assert closer.is_alive() and not resource.closed
+    release.set()
+    closer.join(5)
+    assert resource.closed